@@ -27,19 +27,61 @@ import json
 import os
 import uuid
 
+try:
+  import orjson  # pylint: disable=g-import-not-at-top
+except ImportError:
+  orjson = None
+
+
+def _LoadJsonFile(file_path):
+  """Reads and parses the JSON file at the given path."""
+  # The whole file is read at once, so the BufferedReader is skipped; the raw
+  # FileIO already sizes its read from fstat.
+  with open(file_path, 'rb', buffering=0) as f:
+    data = f.read()
+  # Input is always parsed with the json module: orjson silently turns integers
+  # outside the 64-bit range into floats, which would alter FHIR decimals.
+  return json.loads(data)
+
+
+def _DumpJson(obj):
+  """Serializes the given object to indented, newline-terminated JSON bytes."""
+  if orjson is not None:
+    try:
+      return orjson.dumps(
+          obj, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE
+      )
+    except orjson.JSONEncodeError:
+      # orjson cannot encode integers outside the 64-bit range or strings
+      # containing lone surrogates, both of which the json module preserves.
+      pass
+  return (json.dumps(obj, indent=2) + '\n').encode('utf-8')
+
 
 class FhirProfileValidationResourcesBundler:
   """Wraps FHIR profile validation resources into a FHIR transaction bundle."""
 
+  __slots__ = (
+      'resource_id_to_uuid_map',
+      '_id_hash_cache',
+      '_bundle_entry_requests',
+  )
+
   def __init__(self):
     # In order to ensure that resource references within the IG are maintained
     # when the server processes the bundle, we need to assign each resource a
     # UUID:
     # https://cloud.google.com/healthcare-api/docs/how-tos/fhir-bundles#resolving_references_to_resources_created_in_a_bundle
     # The dict maps resourceType/resourceID references that the IG currently has
-    # to UUIDs that will be generated, and the set helps prevent dupes.
+    # to UUIDs that will be generated. Version 4 UUIDs are random enough that
+    # collisions need not be checked for.
     self.resource_id_to_uuid_map = {}
-    self.uuid_tracker = set()
+    # Caches resource IDs by (url, version), since some resource sets contain
+    # several resources sharing the same combination.
+    self._id_hash_cache = {}
+    # Bundle entry requests only vary by resourceType, so a single request dict
+    # is shared by all entries of the same type. They are never modified.
+    self._bundle_entry_requests = {}
 
   def GetAttributeFlags(self):
     """Gets attributes passed in by the user via the command line.
@@ -95,27 +137,16 @@ class FhirProfileValidationResourcesBundler:
     )
     args = parser.parse_args()
 
-    ig_folder = args.input_dir
-    is_ig_dir_abs_path = os.path.isabs(ig_folder)
-    if is_ig_dir_abs_path:
-      source_dir = ig_folder
-    else:
-      source_dir = os.path.join(os.getcwd(), os.path.relpath(ig_folder))
-
+    # Equivalent to os.path.abspath, but looks up the cwd only once for both
+    # directories. Joining onto an absolute path leaves the cwd out.
+    cwd = os.getcwd()
+    source_dir = os.path.normpath(os.path.join(cwd, args.input_dir))
     if not os.path.exists(source_dir):
       raise ValueError('Given directory does not exist!')
 
-    bundle_dest_folder = args.output_dir
-    is_bundle_dest_dir_abs_path = os.path.isabs(bundle_dest_folder)
-    if is_bundle_dest_dir_abs_path:
-      target_dir = bundle_dest_folder
-    else:
-      target_dir = os.path.join(
-          os.getcwd(), os.path.relpath(bundle_dest_folder)
-      )
+    target_dir = os.path.normpath(os.path.join(cwd, args.output_dir))
 
-    if not os.path.exists(target_dir):
-      os.mkdir(target_dir)
+    os.makedirs(target_dir, exist_ok=True)
 
     do_construct_global_array = args.generate_global_array
     return source_dir, target_dir, do_construct_global_array
@@ -146,20 +177,22 @@ class FhirProfileValidationResourcesBundler:
         'entry': bundle_entries,
     }
     ig_resource = {}
-    for child in os.listdir(source_dir):
-      file_path = os.path.join(source_dir, child)
-      if os.path.isfile(file_path):
-        with open(file_path, 'r') as f:
-          resource = json.load(f)
-          resource_type = resource['resourceType']
-          if resource_type != 'ImplementationGuide':
-            # Process these first
-            bundle_entry, global_array = self.ProcessProfileValidationResource(
-                resource, do_construct_global_array, global_array
-            )
-            bundle_entries.append(bundle_entry)
-          else:
-            ig_resource = resource
+    # DirEntry caches the file type from the directory listing, which saves a
+    # stat call per file compared to os.path.isfile.
+    with os.scandir(source_dir) as entries:
+      for entry in entries:
+        if not entry.is_file():
+          continue
+        resource = _LoadJsonFile(entry.path)
+        resource_type = resource['resourceType']
+        if resource_type != 'ImplementationGuide':
+          # Process these first
+          bundle_entry = self.ProcessProfileValidationResource(
+              resource, do_construct_global_array, global_array
+          )
+          bundle_entries.append(bundle_entry)
+        else:
+          ig_resource = resource
     if not ig_resource:
       raise ValueError(
           'An ImplementationGuide resource was not provided in the input'
@@ -182,11 +215,10 @@ class FhirProfileValidationResourcesBundler:
         array with this resource's type and URL. This is only done for
         StructureDefinitions.
       global_array: array containing accumulating all StructureDefinition
-        references.
+        references. It is appended to in place.
 
     Returns:
-      A bundle entry representing the resource in the bundle and the
-      global_array.
+      A bundle entry representing the resource in the bundle.
     """
     resource_type = resource['resourceType']
     # See
@@ -201,9 +233,14 @@ class FhirProfileValidationResourcesBundler:
     resource_url = resource['url']
     resource_version = resource['version']
     if resource_url and resource_version:
-      m = hashlib.sha256()
-      m.update(bytes(resource_url + '|' + resource_version, 'utf-8'))
-      resource['id'] = m.hexdigest()
+      id_hash_key = (resource_url, resource_version)
+      id_hash = self._id_hash_cache.get(id_hash_key)
+      if id_hash is None:
+        m = hashlib.sha256(resource_url.encode('utf-8'))
+        m.update(b'|')
+        m.update(resource_version.encode('utf-8'))
+        id_hash = self._id_hash_cache[id_hash_key] = m.hexdigest()
+      resource['id'] = id_hash
 
     # Refer to cloud.google.com/healthcare-api/docs/how-tos/fhir-profiles
     if do_construct_global_array and resource_type == 'StructureDefinition':
@@ -225,15 +262,18 @@ class FhirProfileValidationResourcesBundler:
           'kind'='resource') can be referred to by the ImplementationGuide. This
           will be skipped. Refer to "Usage notes" in the README for more info.
         """)
+    request = self._bundle_entry_requests.get(resource_type)
+    if request is None:
+      request = self._bundle_entry_requests[resource_type] = {
+          'method': 'POST',
+          'url': resource_type,
+      }
     resource_bundle_entry = {
         'resource': resource,
         'fullUrl': resource_uuid,
-        'request': {
-            'method': 'POST',
-            'url': resource_type,
-        },
+        'request': request,
     }
-    return resource_bundle_entry, global_array
+    return resource_bundle_entry
 
   def ProcessImplementationGuideResource(
       self, resource, do_construct_global_array, global_array
@@ -254,26 +294,22 @@ class FhirProfileValidationResourcesBundler:
     if definition:
       definition_resources = definition.get('resource')
       if definition_resources:
-        final_definition_resources = []
-        for definition_resource in definition_resources:
-          # Example resources do not actually exist in the IG set; the IG just
-          # has references to them that lead nowhere
-          if (
-              'exampleBoolean' in definition_resource
-              and not definition_resource['exampleBoolean']
-          ) and 'exampleCanonical' not in definition_resource:
-            referenced_resource_identifier = definition_resource['reference'][
-                'reference'
-            ]
-            referenced_resource_uuid = self.resource_id_to_uuid_map[
-                referenced_resource_identifier
-            ]
-            definition_resource['reference'][
-                'reference'
-            ] = referenced_resource_uuid
-            final_definition_resources.append(definition_resource)
-
-        resource['definition']['resource'] = final_definition_resources
+        resource_id_to_uuid_map = self.resource_id_to_uuid_map
+        # Example resources do not actually exist in the IG set; the IG just
+        # has references to them that lead nowhere
+        final_definition_resources = [
+            definition_resource
+            for definition_resource in definition_resources
+            if definition_resource.get('exampleBoolean') is False
+            and 'exampleCanonical' not in definition_resource
+        ]
+        for definition_resource in final_definition_resources:
+          reference = definition_resource['reference']
+          reference['reference'] = resource_id_to_uuid_map[
+              reference['reference']
+          ]
+
+        definition['resource'] = final_definition_resources
 
     resource_uuid = self.__generate_uuid__(
         'ImplementationGuide', resource['id']
@@ -299,14 +335,13 @@ class FhirProfileValidationResourcesBundler:
       bundle: the bundle to write out.
     """
     output_file = os.path.join(target_dir, 'bundle.json')
-    with open(output_file, 'w') as f:
-      json.dump(bundle, f, indent=2)
+    # The whole bundle is serialized up front and written in a single call,
+    # rather than streamed out token by token.
+    with open(output_file, 'wb') as f:
+      f.write(_DumpJson(bundle))
 
   def __generate_uuid__(self, resource_type, resource_id):
     uuid_str = 'urn:uuid:' + str(uuid.uuid4())
-    while uuid_str in self.uuid_tracker:
-      uuid_str = 'urn:uuid:' + str(uuid.uuid4())
-    self.uuid_tracker.add(uuid_str)
     resource_identifier = resource_type + '/' + resource_id
     self.resource_id_to_uuid_map[resource_identifier] = uuid_str
     return uuid_str
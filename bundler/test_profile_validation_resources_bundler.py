@@ -14,8 +14,11 @@
 
 """Tests for the bundler for FHIR profile validation resources."""
 
+import hashlib
+import json
 import os
 import sys
+import tempfile
 import unittest
 from unittest import mock
 from . import profile_validation_resources_bundler
@@ -40,8 +43,9 @@ class TestFhirProfileValidationResourcesBundler(unittest.TestCase):
       ],
   )
   @mock.patch.object(os.path, 'exists', return_value=True)
+  @mock.patch.object(os, 'makedirs')
   def test_get_attribute_flags_returns_user_inputs_with_abs_paths_create_global_array(
-      self, unused_os_path_mock
+      self, os_makedirs_mock, unused_os_path_mock
   ):
     """Test ensuring that absolute directory path inputs are processed correctly."""
     source_dir, target_dir, do_construct_global_array = (
@@ -64,6 +68,10 @@ class TestFhirProfileValidationResourcesBundler(unittest.TestCase):
         True,
         'Expected do_construct_global_array to be set to true',
     )
+    os_makedirs_mock.assert_called_once_with(
+        '/an/absolute/directory/path/to/store/output/resource/bundle',
+        exist_ok=True,
+    )
 
   @mock.patch.object(
       sys,
@@ -76,9 +84,10 @@ class TestFhirProfileValidationResourcesBundler(unittest.TestCase):
       ],
   )
   @mock.patch.object(os.path, 'exists', return_value=True)
+  @mock.patch.object(os, 'makedirs')
   @mock.patch.object(os, 'getcwd', return_value='/usr/')
   def test_get_attribute_flags_returns_user_inputs_rel_paths_no_global_array(
-      self, unused_os_path_mock, unused_os_getcwd_mock
+      self, unused_os_path_mock, unused_os_makedirs_mock, unused_os_getcwd_mock
   ):
     """Test ensuring that relative directory paths and the boolean generate global array inputs are processed correctly."""
     source_dir, target_dir, do_construct_global_array = (
@@ -116,9 +125,8 @@ class TestFhirProfileValidationResourcesBundler(unittest.TestCase):
         'type': 'Patient',
         'kind': 'resource',
     }
-    _, global_array = self.bundler.ProcessProfileValidationResource(
-        resource, True, []
-    )
+    global_array = []
+    self.bundler.ProcessProfileValidationResource(resource, True, global_array)
     self.assertIn(
         {
             'type': 'Patient',
@@ -142,9 +150,8 @@ class TestFhirProfileValidationResourcesBundler(unittest.TestCase):
         'type': 'Range',
         'kind': 'complex-type',
     }
-    _, global_array = self.bundler.ProcessProfileValidationResource(
-        resource, True, []
-    )
+    global_array = []
+    self.bundler.ProcessProfileValidationResource(resource, True, global_array)
     self.assertNotIn(
         {
             'type': 'Range',
@@ -165,9 +172,8 @@ class TestFhirProfileValidationResourcesBundler(unittest.TestCase):
         'id': 'vs-1',
         'version': '1.0.0',
     }
-    _, global_array = self.bundler.ProcessProfileValidationResource(
-        resource, True, []
-    )
+    global_array = []
+    self.bundler.ProcessProfileValidationResource(resource, True, global_array)
     self.assertEqual(global_array, [], 'Expected global array to be empty!')
 
   def test_process_profile_validation_resource_generates_and_assigns_fullurl(
@@ -180,7 +186,7 @@ class TestFhirProfileValidationResourcesBundler(unittest.TestCase):
         'id': 'vs-1',
         'version': '1.0.0',
     }
-    bundle_entry, _ = self.bundler.ProcessProfileValidationResource(
+    bundle_entry = self.bundler.ProcessProfileValidationResource(
         resource, True, []
     )
     resource_uuid = bundle_entry['fullUrl']
@@ -193,6 +199,27 @@ class TestFhirProfileValidationResourcesBundler(unittest.TestCase):
         ' entry',
     )
 
+  def test_process_profile_validation_resource_assigns_id_from_url_and_version(
+      self,
+  ):
+    """Test ensuring the resource ID is the SHA-256 hash of its url and version."""
+    resource = {
+        'resourceType': 'ValueSet',
+        'url': 'http://www.hl7.org/some/value/set/resource',
+        'id': 'vs-1',
+        'version': '1.0.0',
+    }
+    bundle_entry = self.bundler.ProcessProfileValidationResource(
+        resource, True, []
+    )
+    self.assertEqual(
+        bundle_entry['resource']['id'],
+        hashlib.sha256(
+            b'http://www.hl7.org/some/value/set/resource|1.0.0'
+        ).hexdigest(),
+        'Expected the resource ID to be derived from its url and version',
+    )
+
   def test_process_implementation_guide_resource_should_include_global_array_if_flag_on(
       self,
   ):
@@ -303,6 +330,207 @@ class TestFhirProfileValidationResourcesBundler(unittest.TestCase):
         definition_resources, [], 'Expected definition resources to be empty!'
     )
 
+  def test_process_profile_validation_resources_at_bundles_all_files(self):
+    """Test ensuring every file in the input directory ends up in the bundle, with the IG last."""
+    resources = {
+        'ig.json': {
+            'resourceType': 'ImplementationGuide',
+            'url': 'http://www.hl7.org/some/implementation/guide/resource',
+            'id': 'ig-1',
+            'version': '1.0.0',
+            'definition': {
+                'resource': [{
+                    'reference': {'reference': 'StructureDefinition/sd-1'},
+                    'exampleBoolean': False,
+                }]
+            },
+        },
+        'sd.json': {
+            'resourceType': 'StructureDefinition',
+            'url': 'http://www.hl7.org/some/structure/definition/for/patient',
+            'id': 'sd-1',
+            'version': '1.0.0',
+            'type': 'Patient',
+            'kind': 'resource',
+        },
+        'vs.json': {
+            'resourceType': 'ValueSet',
+            'url': 'http://www.hl7.org/some/value/set/resource',
+            'id': 'vs-1',
+            'version': '1.0.0',
+        },
+    }
+    with tempfile.TemporaryDirectory() as source_dir:
+      for file_name, resource in resources.items():
+        with open(os.path.join(source_dir, file_name), 'w') as f:
+          json.dump(resource, f)
+      os.mkdir(os.path.join(source_dir, 'a_subdirectory'))
+      bundle = self.bundler.ProcessProfileValidationResourcesAt(
+          source_dir, True
+      )
+
+    entries = bundle['entry']
+    self.assertCountEqual(
+        [entry['request']['url'] for entry in entries],
+        ['StructureDefinition', 'ValueSet', 'ImplementationGuide'],
+        'Expected one bundle entry per input file',
+    )
+    bundled_guide = entries[-1]['resource']
+    self.assertEqual(
+        bundled_guide['resourceType'],
+        'ImplementationGuide',
+        'Expected the ImplementationGuide to be the last bundle entry',
+    )
+    self.assertEqual(
+        bundled_guide['definition']['resource'][0]['reference']['reference'],
+        self.bundler.resource_id_to_uuid_map['StructureDefinition/sd-1'],
+        'Expected the IG definition reference to point at the SD fullUrl',
+    )
+    self.assertEqual(
+        bundled_guide['global'],
+        [{
+            'type': 'Patient',
+            'profile': (
+                'http://www.hl7.org/some/structure/definition/for/patient'
+            ),
+        }],
+        'Expected the IG global array to reference the StructureDefinition',
+    )
+
+  def test_process_profile_validation_resources_at_requires_implementation_guide(
+      self,
+  ):
+    """Test ensuring an input directory without an ImplementationGuide is rejected."""
+    with tempfile.TemporaryDirectory() as source_dir:
+      with open(os.path.join(source_dir, 'vs.json'), 'w') as f:
+        json.dump(
+            {
+                'resourceType': 'ValueSet',
+                'url': 'http://www.hl7.org/some/value/set/resource',
+                'id': 'vs-1',
+                'version': '1.0.0',
+            },
+            f,
+        )
+      with self.assertRaises(ValueError):
+        self.bundler.ProcessProfileValidationResourcesAt(source_dir, True)
+
+  def test_output_profile_validation_resource_bundle_writes_bundle_json(self):
+    """Test ensuring the bundle is written out as a parsable bundle.json."""
+    bundle = {
+        'resourceType': 'Bundle',
+        'type': 'transaction',
+        'entry': [],
+    }
+    with tempfile.TemporaryDirectory() as target_dir:
+      self.bundler.OutputProfileValidationResourceBundle(target_dir, bundle)
+      with open(os.path.join(target_dir, 'bundle.json'), 'r') as f:
+        written_bundle = json.load(f)
+    self.assertEqual(
+        written_bundle, bundle, 'Expected the written bundle to round-trip!'
+    )
+
+  def _BundleDirectoryAndReadBack(self, resources):
+    """Bundles the given resources from a directory and reads bundle.json back."""
+    with tempfile.TemporaryDirectory() as source_dir:
+      for file_name, resource in resources.items():
+        with open(os.path.join(source_dir, file_name), 'w') as f:
+          json.dump(resource, f)
+      bundle = self.bundler.ProcessProfileValidationResourcesAt(
+          source_dir, True
+      )
+    with tempfile.TemporaryDirectory() as target_dir:
+      self.bundler.OutputProfileValidationResourceBundle(target_dir, bundle)
+      with open(os.path.join(target_dir, 'bundle.json'), 'rb') as f:
+        written_bundle = f.read()
+    return written_bundle
+
+  def _ValueSetAndGuideWith(self, value_set_fields):
+    """Returns a minimal ValueSet with the given fields, plus an IG."""
+    value_set = {
+        'resourceType': 'ValueSet',
+        'url': 'http://www.hl7.org/some/value/set/resource',
+        'id': 'vs-1',
+        'version': '1.0.0',
+    }
+    value_set.update(value_set_fields)
+    return {
+        'vs.json': value_set,
+        'ig.json': {
+            'resourceType': 'ImplementationGuide',
+            'url': 'http://www.hl7.org/some/implementation/guide/resource',
+            'id': 'ig-1',
+            'version': '1.0.0',
+        },
+    }
+
+  def test_bundle_preserves_integers_outside_64_bit_range(self):
+    """Test ensuring large numbers in the inputs are not turned into floats."""
+    written_bundle = self._BundleDirectoryAndReadBack(
+        self._ValueSetAndGuideWith({
+            'big': 123456789012345678901234567890,
+            'negative': -99999999999999999999,
+        })
+    )
+    value_set = json.loads(written_bundle)['entry'][0]['resource']
+    self.assertEqual(
+        (value_set['big'], value_set['negative']),
+        (123456789012345678901234567890, -99999999999999999999),
+        'Expected large integers to be written out unchanged',
+    )
+
+  def test_bundle_preserves_lone_surrogate_escapes(self):
+    """Test ensuring strings with lone surrogate escapes can be bundled."""
+    written_bundle = self._BundleDirectoryAndReadBack(
+        self._ValueSetAndGuideWith({'name': '\ud800'})
+    )
+    value_set = json.loads(written_bundle)['entry'][0]['resource']
+    self.assertEqual(
+        value_set['name'],
+        '\ud800',
+        'Expected the lone surrogate to be written out unchanged',
+    )
+
+  @mock.patch.object(profile_validation_resources_bundler, 'orjson', None)
+  def test_bundle_round_trips_without_orjson(self):
+    """Test ensuring the standard library json fallback bundles a directory."""
+    written_bundle = self._BundleDirectoryAndReadBack(
+        self._ValueSetAndGuideWith({'title': 'Caf\u00e9'})
+    )
+    self.assertIn(
+        b'\\u00e9',
+        written_bundle,
+        'Expected the json fallback to escape non-ASCII characters',
+    )
+    self.assertTrue(
+        written_bundle.endswith(b'}\n'),
+        'Expected the bundle to end with a newline',
+    )
+    value_set = json.loads(written_bundle)['entry'][0]['resource']
+    self.assertEqual(
+        value_set['title'],
+        'Caf\u00e9',
+        'Expected the title to round-trip through the json fallback',
+    )
+
+  @mock.patch.object(profile_validation_resources_bundler, 'orjson', None)
+  def test_output_profile_validation_resource_bundle_writes_bundle_json_without_orjson(
+      self,
+  ):
+    """Test ensuring the json fallback writes out a parsable bundle.json."""
+    bundle = {
+        'resourceType': 'Bundle',
+        'type': 'transaction',
+        'entry': [],
+    }
+    with tempfile.TemporaryDirectory() as target_dir:
+      self.bundler.OutputProfileValidationResourceBundle(target_dir, bundle)
+      with open(os.path.join(target_dir, 'bundle.json'), 'r') as f:
+        written_bundle = json.load(f)
+    self.assertEqual(
+        written_bundle, bundle, 'Expected the written bundle to round-trip!'
+    )
+
 
 if __name__ == '__main__':
   unittest.main()